@@ -11,16 +11,19 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[(d, os.path.dirname(d)) for d in glob("dicombrowser/res/*")],
-    hiddenimports=["pydicom.encoders.gdcm", "pydicom.encoders.pylibjpeg", "pydicom.encoders.native"],
-    hookspath=[],
+    hiddenimports=[],
+    hookspath=["dicombrowser/__pyinstaller"],  # hidden imports are declared in hook-dicombrowser.py
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=["tkinter", "matplotlib", "pydicom.tests", "pyqtgraph.examples"],  # unused modules otherwise pulled in
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
     noarchive=False,
 )
+# the application is English only so Qt's translation files aren't needed
+a.datas = [d for d in a.datas if "translations" not in d[0].replace("\\", "/").split("/")]
+
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
 exe = EXE(
@@ -0,0 +1,25 @@
+# DicomBrowser
+# Copyright (C) 2016-22 Eric Kerfoot, King's College London, all rights reserved
+#
+# This file is part of DicomBrowser.
+#
+# DicomBrowser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DicomBrowser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program (LICENSE.txt).  If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+
+
+def get_hook_dirs():
+    """Return the directory containing the PyInstaller hooks for DicomBrowser, used by the pyinstaller40 entry point."""
+    return [os.path.dirname(__file__)]
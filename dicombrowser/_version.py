@@ -17,8 +17,8 @@
 # with this program (LICENSE.txt).  If not, see <http://www.gnu.org/licenses/>
 
 __appname__ = "DicomBrowser"
-__version_info__ = (1, 5, 1)  # global application version, major/minor/patch
-__version__ = f"{__version_info__[0]}.{__version_info__[1]}.{__version_info__[2]}"
+__version__ = "1.5.1"  # global application version, a literal so setuptools can read it without importing the package
+__version_info__ = tuple(map(int, __version__.split(".")))  # major/minor/patch
 __author__ = "Eric Kerfoot"
 __author_email__ = "eric.kerfoot@kcl.ac.uk"
 __copyright__ = "Copyright (c) 2016-22 Eric Kerfoot, King's College London, all rights reserved. Licensed under the GPL (see LICENSE.txt)."
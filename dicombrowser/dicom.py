@@ -16,11 +16,13 @@
 # You should have received a copy of the GNU General Public License along
 # with this program (LICENSE.txt).  If not, see <http://www.gnu.org/licenses/>
 
+import math
 import os
+import sys
+import threading
 import zipfile
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from io import BytesIO
-from glob import glob
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from warnings import warn
 
 import numpy as np
@@ -50,6 +52,19 @@ LOAD_ATTRS = (
     "StudyDescription",
 )
 
+# maximum number of files each worker process loads per task when scanning a directory, larger batches amortise the IPC
+# costs but smaller ones are used if needed to give every worker several batches
+LOAD_BATCH_SIZE = 128
+
+# maximum number of zip members each worker process loads per task, these are smaller since pixel data is loaded too
+ZIP_BATCH_SIZE = 16
+
+# zip file opened in a worker process by open_worker_zip(), this is None in the main process
+_worker_zip = None
+
+# maximum number of images and of attribute datasets loaded on demand to keep in the caches of a DicomSeries
+CACHE_SIZE = 64
+
 # keyword/full name pairs for extra properties not represented as Dicom attributes
 EXTRA_KEYWORDS = {
     "NumImages": "# Images",
@@ -65,6 +80,8 @@ KEYWORD_NAME_MAP.update(EXTRA_KEYWORDS)
 
 FULL_NAME_MAP = {v: k for k, v in KEYWORD_NAME_MAP.items()}  # maps full names to keywords
 
+LOAD_TAGS = tuple((n, datadict.tag_for_keyword(n)) for n in LOAD_ATTRS)  # (keyword, tag) pairs for LOAD_ATTRS
+
 
 def get_2d_equivalent_image(img):
     """Given an array `img` of some arbitrary dimensions, attempt to choose a valid 2D gray/RGB/RGBA image from it."""
@@ -91,26 +108,97 @@ def get_2d_equivalent_image(img):
 
 
 def get_scaled_image(dcm):
-    """Return image data from `dcm` scaled using slope and intercept values."""
+    """
+    Return image data from `dcm` scaled using slope and intercept values. The pixel array is returned unchanged if no
+    scaling is needed, otherwise the result is a float32 array computed without an intermediate array.
+    """
     try:
+        pixels = dcm.pixel_array
         rslope = float(dcm.get("RescaleSlope", 1) or 1)
         rinter = float(dcm.get("RescaleIntercept", 0) or 0)
-        img = dcm.pixel_array * rslope + rinter
+
+        if rslope == 1 and rinter == 0:
+            return pixels
+
+        img = np.multiply(pixels, np.float32(rslope), dtype=np.float32)
+        img += np.float32(rinter)
         return img
     except (KeyError, ValueError, AttributeError):
         return None
 
 
+def iter_files(rootdir, _visited=None):
+    """
+    Yield the path of every regular file found recursively in `rootdir`, skipping DICOMDIR index files and, as glob()
+    does, hidden files and directories. Symlinks are followed but each directory is visited once so link cycles end,
+    and directories which can't be read are skipped.
+    """
+    if _visited is None:
+        _visited = set()
+
+    try:
+        st = os.stat(rootdir)
+        dirkey = (st.st_dev, st.st_ino)  # identifies the directory whichever path or link it was reached through
+
+        if dirkey in _visited:
+            return
+
+        _visited.add(dirkey)
+
+        with os.scandir(rootdir) as it:
+            entries = list(it)
+    except OSError:
+        return  # unreadable directories are ignored as glob() would
+
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+
+        try:
+            if entry.is_dir():
+                yield from iter_files(entry.path, _visited)
+            elif entry.is_file() and entry.name.lower() != "dicomdir":
+                yield entry.path
+        except OSError:
+            continue  # entry vanished or can't be stat'd
+
+
 def load_dicom_file(filename):
     """Load the Dicom file `filename`, returns the filename and an abbreviated attribute dictionary."""
+    # pydicom rejects files without the "DICM" magic number after the preamble, check for it first to skip other files
+    # without paying for a parse attempt and the raised exception
+    with open(filename, "rb") as o:
+        o.seek(128)
+        if o.read(4) != b"DICM":
+            return None
+
     try:
-        dcm = dicomio.read_file(filename, stop_before_pixels=True)
-        attrs = {t: dcm.get(t) for t in LOAD_ATTRS if t in dcm}
-        return filename, attrs
+        # large values are deferred, ie. left in the file until accessed, none of the small LOAD_ATTRS values will be
+        tags = [t for _, t in LOAD_TAGS]
+        dcm = dicomio.read_file(filename, stop_before_pixels=True, specific_tags=tags, defer_size="1 KB")
+        attrs = {n: dcm[t].value for n, t in LOAD_TAGS if t in dcm}  # index by tag to avoid keyword lookups
+
+        if "SeriesInstanceUID" in attrs:  # files without a series can't be placed in one so are skipped
+            return filename, attrs
     except errors.InvalidDicomError:
         pass
 
 
+def get_batch_size(numitems, numprocs, maxsize):
+    """
+    Return the batch size for splitting `numitems` tasks between `numprocs` processes (os.cpu_count() if None), this is
+    at most `maxsize` but small enough for each process to be given around 4 batches so that all processes are used.
+    """
+    numprocs = numprocs or os.cpu_count() or 1
+    return max(1, min(maxsize, math.ceil(numitems / (numprocs * 4))))
+
+
+def load_dicom_batch(filenames):
+    """Load each Dicom file in `filenames`, returns a list of load_dicom_file() results for those which are Dicoms."""
+    results = (load_dicom_file(f) for f in filenames)
+    return [r for r in results if r is not None]
+
+
 def load_dicom_dir(rootdir, statusfunc=lambda s, c, n: None, numprocs=None):
     """
     Load all the Dicom files from `rootdir` using `numprocs` number of processes. This will attempt to load each file
@@ -120,72 +208,107 @@ def load_dicom_dir(rootdir, statusfunc=lambda s, c, n: None, numprocs=None):
     loaded objects, and the total number to load. A status string of '' indicates loading is done. The default value
     causes no status indication to be made. Return value is a sequence of DicomSeries objects in no particular order.
     """
-    allfiles = list(filter(os.path.isfile, glob(rootdir + "/**", recursive=True)))
+    allfiles = list(iter_files(rootdir))
 
     numfiles = len(allfiles)
     series = {}
-    count = 0
 
     if numfiles == 0:
         return []
 
-    with ProcessPoolExecutor(max_workers=numprocs) as p:
-        futures = [p.submit(load_dicom_file, f) for f in allfiles]
+    # workers are given batches of files so that each task and its pickled results covers many files at once
+    batchsize = get_batch_size(numfiles, numprocs, LOAD_BATCH_SIZE)
+    batches = [allfiles[i : i + batchsize] for i in range(0, numfiles, batchsize)]
+    count = 0
 
-        for count, future in enumerate(as_completed(futures)):
-            result = future.result()
-            if result is not None:
-                filename, dcm = result
-                seriesid = dcm.get("SeriesInstanceUID", "???")
+    with ProcessPoolExecutor(max_workers=numprocs) as p:
+        for batch, results in zip(batches, p.map(load_dicom_batch, batches)):
+            for filename, dcm in results:
+                seriesid = dcm["SeriesInstanceUID"]
                 if seriesid not in series:
                     series[seriesid] = DicomSeries(seriesid, rootdir)
 
                 series[seriesid].add_file(filename, dcm)
 
-            if numfiles < 100 or count % (numfiles // 100) == 0:
-                statusfunc("Loading DICOM files", count, numfiles)
+            count += len(batch)
+            statusfunc("Loading DICOM files", count, numfiles)  # status is updated once per batch
 
     statusfunc("", 0, 0)
     return list(series.values())
 
 
-def load_dicom_zip(filename, statusfunc=lambda s, c, n: None):
+def open_worker_zip(filename):
+    """
+    Open the zip file `filename` as the zip file of this worker process, used as a process pool initializer so that the
+    zip's central directory is read once per process rather than once per batch. The file is closed at process exit.
     """
-    Load Dicom images from given zip file `filename'. This uses the status callback `statusfunc' like load_dicom_dir().
-    Loaded files will have their pixel data thus avoiding the need to reload the zip file when an image is viewed but is
-    at the expense of load time and memory. Return value is a sequence of DicomSeries objects in no particular order.
+    global _worker_zip
+    _worker_zip = zipfile.ZipFile(filename)
+
+
+def load_zip_batch(names, zfile=None):
+    """
+    Load the Dicom files `names` from the ZipFile `zfile`, or the zip opened by open_worker_zip() if None. Returns a
+    list of (name, dataset, image) triples for those which are Dicoms. The image is the scaled pixel array or None, the
+    pixel data element is removed from the dataset since the image has already been extracted and the dataset would
+    otherwise be pickled with it.
+    """
+    z = zfile if zfile is not None else _worker_zip
+    results = []
+
+    for n in names:
+        try:
+            with z.open(n) as o:  # read from the member stream rather than copying it into memory first
+                dcm = dicomio.read_file(o)
+        except errors.InvalidDicomError:
+            continue  # ignore files which aren't Dicom files
+
+        if "SeriesInstanceUID" not in dcm:
+            continue  # ignore files without a series to place them in
+
+        # need to load image data now since we don't want to reload the zip file later when an image is viewed
+        img = get_scaled_image(dcm)  # attempt to create the image array, store None if this doesn't work
+
+        if "PixelData" in dcm:
+            del dcm.PixelData
+
+        results.append((n, dcm, img))
+
+    return results
+
+
+def load_dicom_zip(filename, statusfunc=lambda s, c, n: None, numprocs=None):
+    """
+    Load Dicom images from given zip file `filename' using `numprocs` number of processes. This uses the status callback
+    `statusfunc' like load_dicom_dir(). Loaded files will have their pixel data thus avoiding the need to reload the zip
+    file when an image is viewed but is at the expense of load time and memory. Return value is a sequence of
+    DicomSeries objects in no particular order.
     """
     series = {}
     count = 0
 
     with zipfile.ZipFile(filename) as z:
         names = z.namelist()
-        numfiles = len(names)
 
-        for n in names:
-            nfilename = f"{filename}?{n}"
-            s = BytesIO(z.read(n))
+    numfiles = len(names)
+    batchsize = get_batch_size(numfiles, numprocs, ZIP_BATCH_SIZE)
+    batches = [names[i : i + batchsize] for i in range(0, numfiles, batchsize)]
 
-            try:
-                dcm = dicomio.read_file(s)
-            except errors.InvalidDicomError:
-                pass  # ignore files which aren't Dicom files, various exceptions raised so no concise way to do this
-            else:
-                seriesid = dcm.get("SeriesInstanceUID", "???")
+    # each process opens its own handle to the zip once, the file object can't be shared between processes
+    with ProcessPoolExecutor(max_workers=numprocs, initializer=open_worker_zip, initargs=(filename,)) as p:
+        for batch, results in zip(batches, p.map(load_zip_batch, batches)):
+            for n, dcm, img in results:
+                nfilename = f"{filename}?{n}"
+                seriesid = dcm.SeriesInstanceUID
 
                 if seriesid not in series:
-                    series[seriesid] = DicomSeries(seriesid, nfilename)
-
-                # need to load image data now since we don't want to reload the zip file later when an image is viewed
-                img = get_scaled_image(dcm)  # attempt to create the image array, store None if this doesn't work
+                    # images are only loaded with the zip file so must all remain cached, the cache is left unbounded
+                    series[seriesid] = DicomSeries(seriesid, nfilename, None)
 
-                s = series[seriesid]
-                s.add_file(nfilename, dcm, dcm, img)
+                series[seriesid].add_file(nfilename, dcm, dcm, img)
 
-            count += 1
-            # update status only 100 times, doing it too frequently really slows things down
-            if numfiles < 100 or count % (numfiles // 100) == 0:
-                statusfunc("Loading DICOM files", count, numfiles)
+            count += len(batch)
+            statusfunc("Loading DICOM files", count, numfiles)  # status is updated once per batch
 
     statusfunc("", 0, 0)
 
@@ -199,21 +322,49 @@ class DicomSeries(object):
     Dicoms should be organized by series. This type will also cache loaded Dicom attrs and images
     """
 
-    def __init__(self, series_id, rootdir):
-        self.series_id = series_id  # ID of the series or ???
+    __slots__ = (
+        "series_id",
+        "rootdir",
+        "filenames",
+        "loadattrs",
+        "imgcache",
+        "cache_size",
+        "attrcache",
+        "_extra_cache",
+        "_shared_attrs",
+        "_imgcache_lock",
+    )
+
+    def __init__(self, series_id, rootdir, cache_size=CACHE_SIZE):
+        self.series_id = series_id  # SeriesInstanceUID of the series
         self.rootdir = rootdir  # directory Dicoms were loaded from, files for this series may be in subdirectories
         self.filenames = []  # list of filenames for the Dicom associated with this series
         self.loadattrs = []  # loaded abbreviated attr->(name,value) maps, 1 for each of self.filenames
-        self.imgcache = {}  # image data cache, mapping index in self.filenames to arrays or None for non-images files
-        self.attrcache = {}  # attribute cache, mapping index in self.filenames to dict of attr->(name,value) mappings
+        self.imgcache = OrderedDict()  # image data cache, mapping index in self.filenames to arrays or None, LRU order
+        self.cache_size = cache_size  # maximum number of images and datasets loaded on demand, None for no limit
+        self.attrcache = OrderedDict()  # attribute cache, mapping index in self.filenames to datasets, LRU order
+        self._extra_cache = None  # cached result of get_extra_attr_values(), reset when files are added
+        self._shared_attrs = {}  # last value added for each loaded attribute, used to share equal values between files
+        self._imgcache_lock = threading.Lock()  # images may be loaded from threads other than the UI thread
 
     def add_file(self, filename, loadattr, attrs=None, img=None):
         """
         Add a filename and abbreviated attribute map `loadattr` to the series. Further attributes and image data given
-        in `attrs` and `img` will be be cached if provided.
+        in `attrs` and `img` will be be cached if provided. Values in `loadattr` equal to those of the previously added
+        file are replaced with the same objects so that values constant across the series are only stored once.
         """
+        if type(loadattr) is dict:  # datasets loaded from zip files are kept as they are
+            shared = self._shared_attrs
+            for k, v in loadattr.items():
+                sv = shared.get(k)
+                if sv is not None and sv == v:
+                    loadattr[k] = sv
+                else:
+                    shared[k] = loadattr[k] = sys.intern(v) if type(v) is str else v
+
         self.filenames.append(filename)
         self.loadattrs.append(loadattr)
+        self._extra_cache = None
 
         if attrs is not None or img is not None:
             idx = len(self.filenames) - 1
@@ -221,51 +372,104 @@ class DicomSeries(object):
             self.imgcache[idx] = img
 
     def sort_filenames(self):
-        """Concurrently sort filenames and associated attributes lists."""
-        self.filenames, self.loadattrs = zip(*sorted(zip(self.filenames, self.loadattrs)))
+        """
+        Concurrently sort filenames and associated attributes lists. Cached attributes and images are moved to the new
+        indices of their files.
+        """
+        order = np.argsort(np.asarray(self.filenames), kind="stable").tolist()
+        newindex = {old: new for new, old in enumerate(order)}
+
+        self.filenames = [self.filenames[i] for i in order]
+        self.loadattrs = [self.loadattrs[i] for i in order]
+        self.attrcache = OrderedDict((newindex[i], v) for i, v in self.attrcache.items())
+
+        with self._imgcache_lock:
+            self.imgcache = OrderedDict((newindex[i], v) for i, v in self.imgcache.items())  # keeps the LRU order
+
+    def get_attr_object(self, index, tags=None):
+        """
+        Get the object storing attr information from Dicom file at the given index. If `tags` is a sequence of attribute
+        names and the file isn't already cached, only these attributes are read and the returned object isn't cached.
+        """
+        dcm = self.attrcache.get(index)
+
+        if dcm is not None:
+            self.attrcache.move_to_end(index)
+        elif tags is not None:
+            dcm = dicomio.read_file(self.filenames[index], stop_before_pixels=True, specific_tags=list(tags))
+        else:
+            # evict the least recently used datasets, series whose files can't be reread have no limit
+            while self.attrcache and self.cache_size is not None and len(self.attrcache) >= self.cache_size:
+                self.attrcache.popitem(last=False)
 
-    def get_attr_object(self, index):
-        """Get the object storing attr information from Dicom file at the given index."""
-        if index not in self.attrcache:
             dcm = dicomio.read_file(self.filenames[index], stop_before_pixels=True)
             self.attrcache[index] = dcm
 
-        return self.attrcache[index]
+        return dcm
 
     def get_extra_attr_values(self):
         """Return the extra attr values calculated from the series attr info stored in self.filenames."""
-        start, interval, numtimes = self.get_timestep_spec()
-        extravals = {
-            "NumImages": len(self.filenames),
-            "TimestepSpec": f"start: {start}, interval: {interval}, # Steps: {numtimes}",
-            "StartTime": start,
-            "NumTimesteps": numtimes,
-            "TimeInterval": interval,
-        }
-
-        return extravals
+        if self._extra_cache is None:
+            start, interval, numtimes = self.get_timestep_spec()
+            self._extra_cache = {
+                "NumImages": len(self.filenames),
+                "TimestepSpec": f"start: {start}, interval: {interval}, # Steps: {numtimes}",
+                "StartTime": start,
+                "NumTimesteps": numtimes,
+                "TimeInterval": interval,
+            }
+
+        return self._extra_cache
 
     def get_attr_values(self, names, index=0):
         """Get the attr values for attr names listed in `names` for image at the given index."""
         if not self.filenames:
             return ()
 
-        dcm = self.get_attr_object(index)
+        # tags are None for names which aren't Dicom keywords
+        name_tags = [(n, datadict.tag_for_keyword(n) if n else None) for n in names]
+
+        # only read the named attributes which are Dicom keywords, the extra values are computed separately
+        dcm = self.get_attr_object(index, [t for _, t in name_tags if t is not None])
         extravals = self.get_extra_attr_values()
 
         # TODO: kludge? More general solution of telling series apart
         # dcm.SeriesDescription=dcm.get('SeriesDescription',dcm.get('SeriesInstanceUID','???'))
 
-        return tuple(str(dcm.get(n, extravals.get(n, ""))) for n in names)
+        values = []
+        for n, tag in name_tags:
+            if tag is not None and tag in dcm:
+                value = dcm[tag].value  # indexing by tag avoids a keyword lookup in the Dicom dictionary
+            else:
+                value = extravals.get(n, "")
+
+            values.append(str(value))
+
+        return tuple(values)
 
     def get_pixel_data(self, index):
-        """Get the pixel data array for file at position `index` in self.filenames, or None if no pixel data."""
-        if index not in self.imgcache:
-            dcm = dicomio.read_file(self.filenames[index])
-            img = get_scaled_image(dcm)
-            self.imgcache[index] = img
+        """
+        Get the pixel data array for file at position `index` in self.filenames, or None if no pixel data. This is safe
+        to call from multiple threads, files are read outside the cache lock so one thread's load doesn't block others.
+        """
+        with self._imgcache_lock:
+            if index in self.imgcache:
+                self.imgcache.move_to_end(index)
+                return self.imgcache[index]
+
+        img = get_scaled_image(dicomio.read_file(self.filenames[index]))
+
+        with self._imgcache_lock:
+            if index in self.imgcache:  # another thread loaded this image meanwhile, keep the array already returned
+                self.imgcache.move_to_end(index)
+            else:
+                # evict the least recently used images, series whose images can't be reloaded from file have no limit
+                while self.imgcache and self.cache_size is not None and len(self.imgcache) >= self.cache_size:
+                    self.imgcache.popitem(last=False)
+
+                self.imgcache[index] = img
 
-        return self.imgcache[index]
+            return self.imgcache[index]
 
     def add_series(self, series):
         """Add every loaded dcm file from DicomSeries object `series` into this series."""
@@ -274,13 +478,13 @@ class DicomSeries(object):
 
     def get_timestep_spec(self, attr="TriggerTime"):
         """Returns (start time, interval, num timesteps) triple."""
-        times = sorted(set(int(loadattr.get(attr, 0)) for loadattr in self.loadattrs))
+        times = (int(loadattr.get(attr, 0)) for loadattr in self.loadattrs)
+        times = np.unique(np.fromiter(times, dtype=np.int64, count=len(self.loadattrs)))  # sorted unique times
 
-        if not times or times == [0]:
+        if times.size == 0 or (times.size == 1 and times[0] == 0):
             return 0.0, 0.0, 0.0
         else:
-            if len(times) == 1:
-                times = times * 2
+            if times.size == 1:
+                return int(times[0]), 0.0, 2  # a single time is reported as 2 steps 0 apart, as it always has been
 
-            avgspan = np.average([b - a for a, b in zip(times, times[1:])])
-            return times[0], avgspan, len(times)
+            return int(times[0]), float(np.diff(times).mean()), times.size
@@ -35,37 +35,72 @@ from PyQt5.QtCore import Qt
 from ._version import __version__
 from . import res
 from .dicom import load_dicom_dir, load_dicom_zip, get_2d_equivalent_image, SERIES_LIST_COLUMNS, ATTR_TREE_COLUMNS
-from .models import AttrItemModel, SeriesTreeModel
+from .models import AttrItemModel, SeriesTreeModel, compile_filter
 
 
 # Load the ui file from the res module and remove the "resources" tag so that uic doesn't try (and fail) to load
 # resources. The path for icons is also changed from what is expected in Designer using resource files to what is
 # used with the search path set in main().
+UI_REGEX = re.compile("(<resources>.*</resources>)|(:/icons/)", re.DOTALL)
+
 ui = pkg_resources.read_text(res, "DicomBrowserWin.ui")
-ui = re.sub("<resources>.*</resources>", "", ui, flags=re.DOTALL)  # get rid of the resources section in the XML
-ui = re.sub(":/icons/", "icons:", ui, flags=re.DOTALL)  # fix icons paths
+# get rid of the resources section in the XML and fix icons paths in one pass
+ui = UI_REGEX.sub(lambda m: "" if m.group(1) else "icons:", ui)
 Ui_DicomBrowserWin, _ = uic.loadUiType(StringIO(ui))  # create a local type definition
 
+PREFETCH_DISTANCE = 2  # number of images either side of the viewed image to load in the background
+
 
 class LoadWorker(QtCore.QRunnable):
-    """Loads Dicom data in a separate thread, updating the UI through the given signals."""
+    """
+    Loads Dicom data in a separate thread, updating the UI through the given signals. If `preload_first` is True the
+    first image of each series is also loaded in this thread so that it's cached before being first viewed.
+    """
 
-    def __init__(self, src, status_signal, update_signal):
+    def __init__(self, src, status_signal, update_signal, preload_first=True):
         super().__init__()
         self.src = src
         self.status_signal = status_signal
         self.update_signal = update_signal
+        self.preload_first = preload_first
 
     def run(self):
         loader = load_dicom_dir if os.path.isdir(self.src) else load_dicom_zip
         series = loader(self.src, self.status_signal.emit)
 
-        if series and all(len(s.filenames) > 0 for s in series):
+        if series and all(s.filenames for s in series):
             for s in series:
                 s.sort_filenames()  # sort series contents by filename
 
             self.update_signal.emit(self.src, series)
 
+            # decode first images after the view is updated, get_pixel_data() is safe if the UI requests one meanwhile
+            if self.preload_first:
+                for s in series:
+                    try:
+                        s.get_pixel_data(0)
+                    except Exception:
+                        pass  # any error will be raised again when the image is viewed
+
+
+class PrefetchWorker(QtCore.QRunnable):
+    """Loads images of a series in a separate thread so that they are already cached when viewed."""
+
+    def __init__(self, series, indices, pending):
+        super().__init__()
+        self.series = series
+        self.indices = indices
+        self.pending = pending  # set of (series, index) pairs queued for loading, each is removed once loaded
+
+    def run(self):
+        for i in self.indices:
+            try:
+                self.series.get_pixel_data(i)
+            except Exception:
+                pass  # any error will be raised again when the image is viewed
+            finally:
+                self.pending.discard((self.series, i))
+
 
 class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
     """
@@ -82,9 +117,12 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
         self.selected_series = None
 
         self.image_index = 0  # index of selected image
-        self.series_columns = list(SERIES_LIST_COLUMNS)  # keywords for columns
+        self.last_render_key = None  # (series, index, auto levels) of the last rendered image
+        self.prefetch_pending = set()  # (series, index) pairs of images queued to be loaded in the background
+        self.series_columns = tuple(SERIES_LIST_COLUMNS)  # keywords for columns
         self.last_dir = "."  # last loaded directory root
-        self.filter_regex = ""  # regular expression to filter attributes by
+        self.attr_view_stale = False  # True if filling the attribute view was skipped while it was hidden
+        self.filter_regex = None  # compiled regular expression to filter attributes by, None for no filtering
 
         # setup ui
         self.setupUi(self)  # create UI elements based on the loaded .ui file
@@ -98,11 +136,11 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
         self.updateSignal.connect(self._update_series_view)
         self.filterLine.textChanged.connect(self._set_filter_string)
         self.imageSlider.valueChanged.connect(self.set_series_image)
+        self.viewMetaSplitter.splitterMoved.connect(self._attr_view_resized)
 
         # setup the attribute and series models
         self.attr_model = AttrItemModel()
         self.series_model = SeriesTreeModel(self.series_columns)
-        self.series_model.layoutChanged.connect(self._series_view_resize)
 
         # assign models to views
         self.attrView.setModel(self.attr_model)
@@ -112,15 +150,26 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
         self.seriesView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.seriesView.selectionModel().currentChanged.connect(self._series_view_current_changed)
 
-        # create the pyqtgraph object for viewing images
+        # create the pyqtgraph object for viewing images, row-major order means arrays are given as
+        # (row, column[, channel])
         self.image_view = pg.ImageView()
+        self.image_view.getImageItem().setOpts(axisOrder="row-major")
         layout = self.view2DGroup.layout()
         layout.insertWidget(0, self.image_view)
 
-        # load the empty image placeholder into a ndarray
-        qimg = QtGui.QImage.fromData(pkg_resources.read_binary(res, "noimage.png"))
-        bytedata = qimg.constBits().asstring(qimg.width() * qimg.height())
-        self.noimg = np.ndarray((qimg.width(), qimg.height()), dtype=np.ubyte, buffer=bytedata)
+        # load the empty image placeholder into a ndarray sharing the image's memory, so the QImage must be kept
+        self.noimg_qimage = QtGui.QImage.fromData(pkg_resources.read_binary(res, "noimage.png"))
+        bits = self.noimg_qimage.constBits()
+        bits.setsize(self.noimg_qimage.sizeInBytes())
+        shape = (self.noimg_qimage.height(), self.noimg_qimage.width())
+        strides = (self.noimg_qimage.bytesPerLine(), 1)  # rows may be padded to 32-bit boundaries
+        self.noimg = np.ndarray(shape, dtype=np.ubyte, buffer=bits, strides=strides)
+
+        # timer to refill the attribute view once typing in the filter line pauses rather than on every keystroke
+        self.filter_timer = QtCore.QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(120)
+        self.filter_timer.timeout.connect(self._fill_attr_view)
 
         # override CTRL+C in the attribute tree to copy a fuller set of attribute data to the clipboard
         QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+c"), self.attrView).activated.connect(self._set_clipboard)
@@ -156,10 +205,11 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
 
     def _update_series_view(self, srcname, series):
         """Updates the series view tree with a new source and updates the layout."""
-        columns = [s.get_attr_values(self.series_columns) for s in series]
+        series_columns = self.series_columns
+        columns = [s.get_attr_values(series_columns) for s in series]
         self.series_model.add_source(srcname, series, columns)
         self.seriesView.expandAll()
-        self.series_model.layoutChanged.emit()
+        self._series_view_resize()  # resize once here rather than on every layout change such as sorting
 
     def _series_view_current_changed(self, current, prev):
         """Called when a series is selected, if different set the viewed series to be visible."""
@@ -170,17 +220,26 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
                 self.set_series_image(self.imageSlider.value(), True)
 
     def _series_view_resize(self):
-        """Resizes self.seriesView columns to contents, setting the last section to stretch."""
+        """Resizes the first column of self.seriesView to its contents, the remaining columns are left interactive."""
         self.seriesView.resizeColumnToContents(0)
 
     def _set_filter_string(self, regex):
-        """Set the filtering regex to be `regex'."""
-        self.filter_regex = regex
-        self._fill_attr_view()
+        """Set the filtering regex to be `regex', this is compiled once here rather than for every refill."""
+        self.filter_regex = compile_filter(regex)
+
+        self.filter_timer.start()  # restarts the timer if already running, so the view is filled once typing stops
 
     def _fill_attr_view(self):
-        """Refill the Dicom attribute view, this will rejig the columns and (unfortunately) reset column sorting."""
+        """
+        Refill the Dicom attribute view, this will rejig the columns and (unfortunately) reset column sorting. If the
+        view is hidden or collapsed this is deferred until it's shown again by moving the splitter.
+        """
         if self.selected_series is not None:
+            if not self.attrView.isVisible() or self.attrView.width() < 4:
+                self.attr_view_stale = True
+                return
+
+            self.attr_view_stale = False
             series = self.selected_series
             vpos = self.attrView.verticalScrollBar().value()
             self.attr_model.fill_attrs(series.get_attr_object(self.image_index), ATTR_TREE_COLUMNS, self.filter_regex)
@@ -188,29 +247,59 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
             self.attrView.resizeColumnToContents(0)
             self.attrView.verticalScrollBar().setValue(vpos)
 
+    def _attr_view_resized(self, *_):
+        """Called when the splitter next to the attribute view moves, fills the view if a fill was deferred."""
+        if self.attr_view_stale:
+            self._fill_attr_view()
+
     def _set_clipboard(self):
         """Set the clipboard to contain fuller attribute data when CTRL+C is applied to a attribute line in the tree."""
 
-        def print_children(child, level, out):
-            for r in range(child.rowCount()):
-                print("", file=out)
+        def children_text(node):
+            """
+            Return the text of the descendants of `node` as a list of strings to join. Each row starts on a new line
+            and each cell is indented by its depth, the tree is walked depth-first with an explicit stack.
+            """
+            parts = []
+            stack = [(node, 1)]  # entries are strings to output or (node, level) pairs whose children are to be walked
+
+            while stack:
+                entry = stack.pop()
+
+                if isinstance(entry, str):
+                    parts.append(entry)
+                    continue
+
+                child, level = entry
+                indent = " " * (level + 1)  # one space per level plus one separating the indent from the text
+                pending = []
+
+                for r in range(child.rowCount()):
+                    pending.append("\n")
 
-                for c in range(child.columnCount()):
-                    cc = child.child(r, c)
+                    for c in range(child.columnCount()):
+                        cc = child.child(r, c)
 
-                    if cc is not None:
-                        print(" " * level, cc.text(), file=out, end="")
-                        if cc.hasChildren():
-                            print_children(cc, level + 1, out)
+                        if cc is not None:
+                            pending.append(indent + cc.text())
+                            if cc.hasChildren():
+                                pending.append((cc, level + 1))
+
+                stack.extend(reversed(pending))  # reversed so that entries are popped in output order
+
+            return parts
 
-        clipout = StringIO()
         items = [self.attr_model.itemFromIndex(i) for i in self.attrView.selectedIndexes()]
-        print(" ".join(i.data() or i.text() for i in items if i), end="", file=clipout)
 
-        if items[0].hasChildren():
-            print_children(items[0], 1, clipout)
+        if not items:
+            return
+
+        parts = [" ".join(i.data() or i.text() for i in items if i)]
+
+        if items[0] is not None and items[0].hasChildren():
+            parts += children_text(items[0])
 
-        QtWidgets.QApplication.clipboard().setText(clipout.getvalue())
+        QtWidgets.QApplication.clipboard().setText("".join(parts))
 
     def set_series_image(self, i, auto_range=False):
         """
@@ -220,7 +309,15 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
         if self.selected_series is not None:
             series = self.selected_series
             maxindex = len(series.filenames) - 1
-            self.image_index = np.clip(i, 0, maxindex)
+            image_index = min(max(int(i), 0), maxindex)  # plain int rather than a numpy scalar from np.clip()
+            render_key = (series, image_index, self.autoLevelsCheck.isChecked())
+
+            # skip rendering if this image is already shown, eg. when the slider value is set to the same index
+            if not auto_range and render_key == self.last_render_key:
+                return
+
+            self.last_render_key = render_key
+            self.image_index = image_index
             img = series.get_pixel_data(self.image_index)  # image matrix
             interval = 1  # tick interval on the slider
 
@@ -230,18 +327,34 @@ class DicomBrowser(QtWidgets.QMainWindow, Ui_DicomBrowserWin):
             elif maxindex >= 500:
                 interval = 10
 
-            if img is None:  # if the image is None use the default "no image" object
+            if img is None:  # if the image is None use the default "no image" object, which is already 2D
                 img = self.noimg
+            else:
+                img = get_2d_equivalent_image(img)  # get something renderable in 2D
 
-            img = get_2d_equivalent_image(img)  # get something renderable in 2D
-
-            self.image_view.setImage(img.T, autoRange=auto_range, autoLevels=self.autoLevelsCheck.isChecked())
+            self.image_view.setImage(img, autoRange=auto_range, autoLevels=self.autoLevelsCheck.isChecked())
+            self._prefetch_images(series, self.image_index)
             self._fill_attr_view()
             self.imageSlider.setTickInterval(interval)
             self.imageSlider.setMaximum(maxindex)
             self.numLabel.setText(str(self.image_index))
-            self.view2DGroup.setTitle("2D View - " + os.path.basename(series.filenames[self.image_index]))
-            self.view2DGroup.setToolTip(series.filenames[self.image_index])
+            filename = series.filenames[self.image_index]
+            self.view2DGroup.setTitle("2D View - " + os.path.basename(filename))
+            self.view2DGroup.setToolTip(filename)
+
+    def _prefetch_images(self, series, index):
+        """Start loading the images of `series` near `index` in the background if they're not cached or queued."""
+        indices = []
+
+        for d in range(1, PREFETCH_DISTANCE + 1):
+            for i in (index + d, index - d):
+                key = (series, i)
+                if 0 <= i < len(series.filenames) and i not in series.imgcache and key not in self.prefetch_pending:
+                    self.prefetch_pending.add(key)
+                    indices.append(i)
+
+        if indices:
+            QtCore.QThreadPool.globalInstance().start(PrefetchWorker(series, indices, self.prefetch_pending))
 
     def set_status(self, msg, progress=0, progressmax=0):
         """
@@ -24,44 +24,102 @@ from PyQt5 import QtGui
 from .dicom import KEYWORD_NAME_MAP
 
 
-def fill_attrs(model, dcm, columns, regex=None, maxValueSize=256):
-    """Fill the model with the attrs from `dcm`."""
+# characters with special meaning in regexes, filter text without any of these is matched as a plain substring
+REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+
+class SubstringPattern:
+    """Stands in for a compiled pattern when the filter text has no regex syntax, searching with a plain `in` test."""
+
+    __slots__ = ("pattern",)
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def search(self, string):
+        """Return True if the pattern text is in `string`, None otherwise as with a failed re.search()."""
+        return True if self.pattern in string else None
+
+
+def compile_filter(text):
+    """
+    Compile the attribute filter `text` into an object with a search() method, or None if `text` is empty or a bad
+    regex. Text without any regex syntax is matched as a plain substring which is faster than the regex engine.
+    """
+    if not text:
+        return None
+
+    if REGEX_SPECIAL_CHARS.isdisjoint(text):
+        return SubstringPattern(text)
+
     try:
-        regex = re.compile(str(regex), re.DOTALL)
-    except:
-        regex = ""  # no regex or bad pattern
+        return re.compile(text, re.DOTALL)
+    except re.error:
+        return None  # partially typed or bad patterns don't filter
+
+
+def format_tag(tag):
+    """Return the "(gggg, eeee)" form of `tag` shown in the attribute tree."""
+    return f"({tag.group:04x}, {tag.elem:04x})"
+
+
+def format_value(value, maxValueSize):
+    """
+    Return the (displayed, original) forms of the string `value` for the attribute tree. Values longer than
+    `maxValueSize` are truncated for display and their original stored as repr(), multiline values are shown as repr().
+    """
+    origvalue = value
+
+    if len(value) > maxValueSize:
+        origvalue = repr(value)
+        value = value[:maxValueSize] + "..."
+
+    if "\n" in value or "\r" in value:  # multiline text data should be shown as repr
+        value = repr(value)
+
+    return value, origvalue
+
+
+def fill_attrs(model, dcm, columns, regex=None, maxValueSize=256):
+    """
+    Fill the model with the attrs from `dcm`. The `regex` filter is a result of compile_filter(), a pattern string
+    which is compiled here, or None for no filtering. Returns a dictionary mapping the tags of the top level
+    non-sequence attributes shown to the items storing their values.
+    """
+    if isinstance(regex, str):
+        regex = compile_filter(regex)
+
+    item_type = QtGui.QStandardItem  # local alias, this is constructed several times for every element
+
+    def _dataset_to_item(parent, d, value_items=None):
+        """
+        Add every element in `d` to the QStandardItem object `parent`, this will be recursive for list elements. The
+        value items of non-sequence elements are stored in `value_items` by tag if given.
+        """
+        append_row = parent.appendRow
 
-    def _dataset_to_item(parent, d):
-        """Add every element in `d` to the QStandardItem object `parent`, this will be recursive for list elements."""
         for elem in d:
             value = _elem_to_value(elem)
-            tag = "(%04x, %04x)" % (elem.tag.group, elem.tag.elem)
-            parent1 = QtGui.QStandardItem(str(elem.name))
-            tagitem = QtGui.QStandardItem(tag)
+            name = elem.name  # pydicom element names are always str
+            tag = format_tag(elem.tag)
+            parent1 = item_type(name)
+            tagitem = item_type(tag)
 
             if isinstance(value, str):
-                origvalue = value
-
-                if len(value) > maxValueSize:
-                    origvalue = repr(value)
-                    value = value[:maxValueSize] + "..."
-
-                try:
-                    value = value.decode("ascii")
-                    if "\n" in value or "\r" in value:  # multiline text data should be shown as repr
-                        value = repr(value)
-                except:
-                    value = repr(value)
+                value, origvalue = format_value(value, maxValueSize)
 
-                if not regex or re.search(regex, str(elem.name) + tag + value) is not None:
-                    item = QtGui.QStandardItem(value)
+                if regex is None or regex.search(name + tag + value) is not None:
+                    item = item_type(value)
                     # original value is stored directly or as repr() form for tag value item, used later when copying
                     item.setData(origvalue)
 
-                    parent.appendRow([parent1, tagitem, item])
+                    append_row([parent1, tagitem, item])
+
+                    if value_items is not None:
+                        value_items[elem.tag] = item
 
             elif value is not None and len(value) > 0:
-                parent.appendRow([parent1, tagitem])
+                append_row([parent1, tagitem])
                 for v in value:
                     parent1.appendRow(v)
 
@@ -72,10 +130,10 @@ def fill_attrs(model, dcm, columns, regex=None, maxValueSize=256):
             value = []
 
             for i, item in enumerate(elem):
-                parent1 = QtGui.QStandardItem("%s %i" % (elem.name, i))
+                parent1 = item_type(f"{elem.name} {i}")
                 _dataset_to_item(parent1, item)
 
-                if not regex or parent1.hasChildren():  # discard sequences whose children have been filtered out
+                if regex is None or parent1.hasChildren():  # discard sequences whose children have been filtered out
                     value.append(parent1)
 
         elif elem.name != "Pixel Data":
@@ -83,18 +141,78 @@ def fill_attrs(model, dcm, columns, regex=None, maxValueSize=256):
 
         return value
 
-    tparent = QtGui.QStandardItem("Attributes")  # create a parent node for all attributes, used for copying data
+    value_items = {}
+    tparent = item_type("Attributes")  # create a parent node for all attributes, used for copying data
+    # build the tree while detached so the model isn't notified for every row
+    _dataset_to_item(tparent, dcm, value_items)
     model.appendRow([tparent])
-    _dataset_to_item(tparent, dcm)
+
+    return value_items
 
 
 class AttrItemModel(QtGui.QStandardItemModel):
     """Manages a list of attributes from a single Dicom file."""
 
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filled = None  # (dataset, regex, maxValueSize) of the last fill
+        self.value_items = {}  # maps tags of shown top level attributes to their value items from the last fill
+
     def fill_attrs(self, dcm, columns, regex=None, maxValueSize=256):
+        """
+        Fill the model with the attrs from `dcm`. If the last fill used the same filter and `dcm` has the same
+        attributes and sequences as that dataset, only the shown values are updated in place rather than rebuilding.
+        """
+        if self.filled is not None and not isinstance(regex, str):
+            prev, prev_regex, prev_size = self.filled
+
+            same_filter = regex is prev_regex and maxValueSize == prev_size
+
+            if same_filter and self._update_values(prev, dcm, regex, maxValueSize):
+                self.filled = (dcm, regex, maxValueSize)
+                return
+
         self.clear()
         self.setHorizontalHeaderLabels(columns)
-        fill_attrs(self, dcm, columns, regex, maxValueSize)  # actual code in a separate function to be usable elsewhere
+        # actual code in a separate function to be usable elsewhere
+        self.value_items = fill_attrs(self, dcm, columns, regex, maxValueSize)
+        self.filled = (dcm, regex, maxValueSize)
+
+    def _update_values(self, prev, dcm, regex, maxValueSize):
+        """
+        Update the value items from the last fill with those of `dcm` if it has the same attributes and sequences as the
+        previous dataset `prev` and the filter `regex` shows the same attributes. Returns False without changing
+        anything if the tree would differ and so must be refilled.
+        """
+        if dcm is prev:
+            return True
+
+        if list(dcm.keys()) != list(prev.keys()):
+            return False
+
+        updates = []
+
+        for elem in dcm:
+            if elem.VR == "SQ":
+                if elem.value != prev[elem.tag].value:
+                    return False
+            elif elem.name != "Pixel Data":
+                value, origvalue = format_value(str(elem.value), maxValueSize)
+                item = self.value_items.get(elem.tag)
+                shown = regex is None or regex.search(elem.name + format_tag(elem.tag) + value) is not None
+
+                if shown != (item is not None):  # attribute would now be filtered differently
+                    return False
+
+                # truncated values can display the same but differ in the full value stored for copying
+                if shown and (item.text() != value or item.data() != origvalue):
+                    updates.append((item, value, origvalue))
+
+        for item, value, origvalue in updates:
+            item.setText(value)
+            item.setData(origvalue)
+
+        return True
 
 
 class SeriesTreeModel(QtGui.QStandardItemModel):
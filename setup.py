@@ -1,7 +1,4 @@
-
-import sys
-from subprocess import check_call
 from setuptools import setup
 
-if __name__ == "__main__":    
+if __name__ == "__main__":
     setup()
@@ -0,0 +1,45 @@
+# DicomBrowser
+# Copyright (C) 2016-22 Eric Kerfoot, King's College London, all rights reserved
+#
+# This file is part of DicomBrowser.
+#
+# DicomBrowser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DicomBrowser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program (LICENSE.txt).  If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # allow the window to be created without a display
+
+QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+pytest.importorskip("pyqtgraph")
+pytest.importorskip("pydicom")
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_create_browser(app):
+    """Smoke test constructing the main window and displaying the placeholder image."""
+    from dicombrowser.dicombrowser import DicomBrowser
+
+    browser = DicomBrowser()
+
+    assert browser.image_view.getImageItem().axisOrder == "row-major"
+
+    browser.image_view.setImage(browser.noimg)
+    assert browser.image_view.getImageItem().image.shape == browser.noimg.shape